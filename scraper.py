@@ -1,14 +1,32 @@
 import gspread
+from gspread.utils import fill_gaps
 from google.oauth2.service_account import Credentials
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from difflib import SequenceMatcher
 import os
-import json
+import orjson
 
 # Configuration - Use the JSON API instead of parsing markdown
 LISTINGS_JSON_URL = 'https://raw.githubusercontent.com/SimplifyJobs/Summer2026-Internships/dev/.github/scripts/listings.json'
 SHEET_ID = os.environ.get('SHEET_ID')
 SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
+REQUEST_TIMEOUT = (3.05, 30)  # (connect, read) seconds
+WRITE_BATCH_CELLS = 10000  # max cells written per batchUpdate call
+ETAG_PATH = '.listings_etag'  # ETag of the last listings.json synced to the sheet
+
+def _build_session():
+    """Create a pooled HTTP session that retries transient GitHub errors"""
+    session = requests.Session()
+    retry = Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504])
+    session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=10, max_retries=retry))
+    session.headers['Accept-Encoding'] = 'gzip'
+    return session
+
+_SESSION = _build_session()
 
 def get_credentials():
     """Load credentials from environment variable"""
@@ -16,40 +34,66 @@ def get_credentials():
     if not creds_json:
         raise ValueError("GOOGLE_CREDENTIALS environment variable not set")
     
-    creds_dict = json.loads(creds_json)
+    creds_dict = orjson.loads(creds_json)
     return Credentials.from_service_account_info(creds_dict, scopes=SCOPES)
 
 def fetch_listings():
-    """Fetch the listings JSON from GitHub"""
-    response = requests.get(LISTINGS_JSON_URL)
+    """Send a conditional GET for the listings JSON
+
+    Returns the streamed response, or None when GitHub reports the file
+    unchanged since the cached ETag. The body is read by load_listings.
+    """
+    headers = {}
+    if os.path.exists(ETAG_PATH):
+        with open(ETAG_PATH) as f:
+            headers['If-None-Match'] = f.read().strip()
+    
+    response = _SESSION.get(LISTINGS_JSON_URL, headers=headers, timeout=REQUEST_TIMEOUT, stream=True)
+    if response.status_code == 304:
+        response.close()
+        return None
     response.raise_for_status()
-    return response.json()
+    return response
+
+def load_listings(response):
+    """Download and decode the body of a fetch_listings response"""
+    return orjson.loads(response.content)
+
+def save_etag(etag):
+    """Remember the ETag of the listings that were just synced"""
+    if etag:
+        with open(ETAG_PATH, 'w') as f:
+            f.write(etag)
 
 def parse_listings(data):
-    """Parse the JSON data into internship listings"""
+    """Parse the JSON data into [company, role, location, link, original_date] rows"""
     internships = []
+    date_cache = {}
     
     for listing in data:
         # Only include active software engineering internships
         if listing.get('active', False) and listing.get('is_visible', True):
-            company_name = listing.get('company_name', '')
-            title = listing.get('title', '')
-            locations = listing.get('locations', [])
-            url = listing.get('url', '')
+            # Keys can be present with a null value, so fall back on falsy too
+            company_name = listing.get('company_name') or ''
+            title = listing.get('title') or ''
+            locations = listing.get('locations') or []
+            url = listing.get('url') or ''
             date_posted_timestamp = listing.get('date_posted', '')
             
             # Convert Unix timestamp to readable date
-            if date_posted_timestamp:
+            date_posted = 'Unknown'
+            if isinstance(date_posted_timestamp, (int, float, str)) and date_posted_timestamp:
                 try:
                     timestamp = int(date_posted_timestamp)
                     # If timestamp is very large, it's in milliseconds
                     if timestamp > 10000000000:
-                        timestamp = timestamp / 1000
-                    date_posted = datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d')
-                except:
+                        timestamp //= 1000
+                    # Many listings share a posting time, so reuse formatted dates
+                    date_posted = date_cache.get(timestamp)
+                    if date_posted is None:
+                        date_posted = date_cache[timestamp] = datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d')
+                except (ValueError, OverflowError, OSError):
                     date_posted = 'Unknown'
-            else:
-                date_posted = 'Unknown'
             
             # Format locations
             if locations:
@@ -59,69 +103,94 @@ def parse_listings(data):
             else:
                 location_str = 'Not specified'
             
-            internships.append({
-                'company': company_name,
-                'role': title,
-                'location': location_str,
-                'link': url,
-                'original_date': date_posted
-            })
+            internships.append([company_name, title, location_str, url, date_posted])
     
     return internships
 
-def update_sheet(internships):
-    """Update Google Sheet with internship data"""
-    creds = get_credentials()
-    client = gspread.authorize(creds)
-    
+def _update_cells_requests(sheet_id, rows, row_index, column_index):
+    """Build updateCells requests writing rows as plain strings at (row_index, column_index)
+
+    Rows are split so no single request carries more than WRITE_BATCH_CELLS cells.
+    """
+    chunk_rows = max(1, WRITE_BATCH_CELLS // len(rows[0]))
+    return [
+        {'updateCells': {
+            'rows': [
+                {'values': [{'userEnteredValue': {'stringValue': '' if value is None else value}} for value in row]}
+                for row in rows[start:start + chunk_rows]
+            ],
+            'fields': 'userEnteredValue',
+            'start': {'sheetId': sheet_id, 'rowIndex': row_index + start, 'columnIndex': column_index}
+        }}
+        for start in range(0, len(rows), chunk_rows)
+    ]
+
+def _send_batches(spreadsheet, units):
+    """Send request units through batchUpdate, at most WRITE_BATCH_CELLS written cells per call
+
+    A unit is a list of requests that must be applied together; calls are only
+    split between units, and a unit larger than the budget is sent on its own.
+    """
+    batch = []
+    batch_cells = 0
+    for unit in units:
+        cells = sum(
+            len(row['values'])
+            for request in unit
+            for row in request.get('updateCells', {}).get('rows', [])
+        )
+        if batch and batch_cells + cells > WRITE_BATCH_CELLS:
+            spreadsheet.batch_update({'requests': batch})
+            batch = []
+            batch_cells = 0
+        batch.extend(unit)
+        batch_cells += cells
+    if batch:
+        spreadsheet.batch_update({'requests': batch})
+
+_CLIENT = None
+
+def _get_client():
+    """Return the authorized gspread client, creating it on first use"""
+    global _CLIENT
+    if _CLIENT is None:
+        # gspread keeps one AuthorizedSession per client, so reusing it
+        # reuses the token and the connection to the Sheets API
+        _CLIENT = gspread.authorize(get_credentials())
+    return _CLIENT
+
+def fetch_sheet():
+    """Open the Google Sheet and return it with its existing rows (header skipped)"""
     # Open the sheet
-    sheet = client.open_by_key(SHEET_ID).sheet1
+    sheet = _get_client().open_by_key(SHEET_ID).sheet1
     
-    # Get existing data (skip header)
-    try:
-        existing_data = sheet.get_all_values()[1:]
-    except:
-        existing_data = []
+    # Get existing data (skip header); only columns A..G are ours, padded to full width.
+    # A failed read must abort the run: update_sheet only writes the differences
+    # against these rows, so treating the sheet as empty would corrupt it
+    existing_data = fill_gaps(sheet.get('A2:G', major_dimension='ROWS'), cols=7)
     
-    # Create map of existing entries
-    existing_map = {}
-    for i, row in enumerate(existing_data):
-        if len(row) >= 2 and row[0] and row[1]:
-            key = f"{row[0]}_{row[1]}"
-            existing_map[key] = {
-                'row_index': i + 2,
-                'date_added_to_sheet': row[4] if len(row) > 4 else '',
-                'original_date': row[5] if len(row) > 5 else ''
-            }
+    return sheet, existing_data
+
+def update_sheet(sheet, existing_data, internships):
+    """Update Google Sheet with internship data"""
+    # Map (company, role) -> (date added to sheet, original date) for existing entries
+    existing_map = {
+        (row[0], row[1]): (row[4] if len(row) > 4 else '', row[5] if len(row) > 5 else '')
+        for row in existing_data
+        if len(row) >= 2 and row[0] and row[1]
+    }
     
     # Prepare new data
     today = datetime.now().strftime('%Y-%m-%d')
     new_data = []
     
-    for internship in internships:
-        key = f"{internship['company']}_{internship['role']}"
-        existing = existing_map.get(key)
+    for company, role, location, link, posted in internships:
+        existing = existing_map.get((company, role))
         
         # Use existing dates if job was already in sheet, otherwise use today
-        date_added = existing['date_added_to_sheet'] if existing else today
-        original_date = existing['original_date'] if existing else internship['original_date']
+        date_added, original_date = existing if existing else (today, posted)
         
-        new_data.append([
-            internship['company'],
-            internship['role'],
-            internship['location'],
-            internship['link'],
-            date_added,
-            original_date,
-            today
-        ])
-    
-    # Clear existing data (keep header)
-    if len(existing_data) > 0:
-        try:
-            sheet.delete_rows(2, len(existing_data) + 1)
-        except:
-            pass
+        new_data.append([company, role, location, link, date_added, original_date, today])
     
     # Write new data
     if new_data:
@@ -129,14 +198,101 @@ def update_sheet(internships):
         # Handle 'Unknown' dates by putting them at the end
         new_data.sort(key=lambda x: x[5] if x[5] != 'Unknown' else '1900-01-01', reverse=True)
         
-        sheet.append_rows(new_data)
-        print(f"Updated sheet with {len(new_data)} internships")
+        # Diff the (company, role) order already in the sheet against the new
+        # order and only insert, delete or rewrite the rows that differ; the
+        # "last seen" column (G) is refreshed for every row as one range
+        sheet_id = sheet.id
+        # Requests are grouped into units that must land in the same
+        # batchUpdate call, so an insert or delete never goes out without
+        # the writes for the rows it shifts
+        units = []
+        changed_rows = 0
+        inserted_rows = 0
+        deleted_rows = 0
+        
+        def write_rows(j1, j2):
+            return _update_cells_requests(
+                sheet_id, [row[:6] for row in new_data[j1:j2]], j1 + 1, 0
+            )
+        
+        def insert_rows(start, end):
+            # Rows are only inserted above existing ones; trailing rows are plain writes
+            return [{'insertDimension': {
+                'range': {'sheetId': sheet_id, 'dimension': 'ROWS', 'startIndex': start + 1, 'endIndex': end + 1},
+                'inheritFromBefore': start > 0
+            }}]
+        
+        def delete_rows(start, end):
+            return [{'deleteDimension': {'range': {
+                'sheetId': sheet_id, 'dimension': 'ROWS', 'startIndex': start + 1, 'endIndex': end + 1
+            }}}]
+        
+        # Opcodes are applied top to bottom, so by the time one is handled the
+        # sheet already holds new_data[:j1] and old row i1 sits at position j1
+        old_keys = [(row[0], row[1]) for row in existing_data]
+        new_keys = [(row[0], row[1]) for row in new_data]
+        matcher = SequenceMatcher(None, old_keys, new_keys, autojunk=False)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == 'equal':
+                run_start = None
+                for k in range(j2 - j1 + 1):
+                    changed = k < j2 - j1 and new_data[j1 + k][:6] != existing_data[i1 + k][:6]
+                    if changed and run_start is None:
+                        run_start = k
+                    elif not changed and run_start is not None:
+                        units.append(write_rows(j1 + run_start, j1 + k))
+                        changed_rows += k - run_start
+                        run_start = None
+                continue
+            
+            unit = []
+            overlap = min(i2 - i1, j2 - j1)
+            if j2 - j1 > overlap and i2 < len(existing_data):
+                unit += insert_rows(j1 + overlap, j2)
+                inserted_rows += j2 - j1 - overlap
+            elif i2 - i1 > overlap:
+                unit += delete_rows(j1 + overlap, j1 + i2 - i1)
+                deleted_rows += i2 - i1 - overlap
+            if j2 > j1:
+                unit += write_rows(j1, j2)
+                changed_rows += j2 - j1
+            units.append(unit)
+        
+        # Grow the grid first if the final row count does not fit
+        grid_rows = sheet.row_count + inserted_rows - deleted_rows
+        if len(new_data) + 1 > grid_rows:
+            units.insert(0, [{'appendDimension': {
+                'sheetId': sheet_id,
+                'dimension': 'ROWS',
+                'length': len(new_data) + 1 - grid_rows
+            }}])
+        
+        # Column G goes last, once every row is in its final position
+        units.extend([request] for request in _update_cells_requests(
+            sheet_id, [row[6:] for row in new_data], 1, 6
+        ))
+        # Typical runs fit in one atomic call; only very large sheets or
+        # rewrites are split, and then only between units
+        _send_batches(sheet.spreadsheet, units)
+        print(f"Updated sheet with {len(new_data)} internships ({changed_rows} rows changed)")
     else:
         print("No internships found")
 
 def main():
     print("Fetching internship listings from JSON...")
-    data = fetch_listings()
+    # Check for changes before touching Sheets at all
+    response = fetch_listings()
+    if response is None:
+        print("Listings unchanged since last run, skipping sheet update")
+        return
+    
+    print("Downloading listings and reading existing sheet rows...")
+    # Overlap the body download and decode with the Sheets auth and read
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        sheet_future = executor.submit(fetch_sheet)
+        data = load_listings(response)
+        sheet, existing_data = sheet_future.result()
+    etag = response.headers.get('ETag')
     print(f"Fetched {len(data)} total listings")
     
     print("\nParsing active internships...")
@@ -147,10 +303,14 @@ def main():
     if internships:
         print("Sample internships:")
         for i, internship in enumerate(internships[:5]):
-            print(f"  {i+1}. {internship['company']} - {internship['role']}")
+            print(f"  {i+1}. {internship[0]} - {internship[1]}")
         
         print("\nUpdating Google Sheet...")
-        update_sheet(internships)
+        update_sheet(sheet, existing_data, internships)
+        # Only record the ETag once the sheet reflects these listings; fetch_sheet
+        # and update_sheet raise on any failed read or write, so reaching this
+        # line means the diff was computed from the real sheet and fully applied
+        save_etag(etag)
         print("Done!")
     else:
         print("ERROR: No internships were found.")